@@ -1,2 +1,14 @@
-from .llm_needle_haystack_tester import LLMNeedleHaystackTester
-from .llm_multi_needle_haystack_tester import LLMMultiNeedleHaystackTester
+from importlib import import_module
+
+# Testers pull in numpy and the evaluator and provider bases, so they are only imported on first access.
+_TESTER_MODULES = {
+    "LLMNeedleHaystackTester": ".llm_needle_haystack_tester",
+    "LLMMultiNeedleHaystackTester": ".llm_multi_needle_haystack_tester",
+}
+
+__all__ = ["LLMMultiNeedleHaystackTester", "LLMNeedleHaystackTester"]
+
+def __getattr__(name):
+    if name in _TESTER_MODULES:
+        return getattr(import_module(_TESTER_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,3 +1,13 @@
+from importlib import import_module
+
 from .evaluator import Evaluator
-from .openai import OpenAIEvaluator
-from .langsmith import LangSmithEvaluator
+
+# Concrete evaluators pull in the OpenAI SDK or LangChain, so they are only imported on first access.
+_EVALUATOR_MODULES = {"OpenAIEvaluator": ".openai", "LangSmithEvaluator": ".langsmith"}
+
+__all__ = ["Evaluator", "LangSmithEvaluator", "OpenAIEvaluator"]
+
+def __getattr__(name):
+    if name in _EVALUATOR_MODULES:
+        return getattr(import_module(_EVALUATOR_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
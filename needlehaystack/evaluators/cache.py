@@ -0,0 +1,147 @@
+import importlib.util
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+class ScoreCache:
+    """
+    Persists evaluator scores in a SQLite table so that reruns over the same setup reuse the
+    scores of earlier runs instead of calling the evaluator API again.
+    """
+
+    def __init__(self, cache_dir: str, ttl: Optional[float] = None):
+        """
+        :param cache_dir: The directory holding the cache database. Created if missing.
+        :param ttl: Seconds after which a cached score is ignored. Default is None, entries never expire.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "scores.sqlite3"),
+                                     check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, score INTEGER NOT NULL, ts REAL NOT NULL)")
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT score, ts FROM scores WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        score, ts = row
+        if self.ttl is not None and time.time() - ts > self.ttl:
+            return None
+        return score
+
+    def set(self, key: bytes, score: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO scores (key, score, ts) VALUES (?, ?, ?)",
+                               (key, score, time.time()))
+
+    def close(self):
+        self._conn.close()
+
+
+class SemanticScoreCache:
+    """
+    Reuses the score of an earlier response when a new response is a near paraphrase of it, e.g.
+    two differently worded refusals. Responses are embedded with a small local sentence-transformers
+    model and matched by cosine similarity. Requires the optional `semantic-cache` extra.
+    """
+    DEFAULT_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    SAVE_EVERY: int = 64
+
+    def __init__(self, path: str, threshold: float = 0.95, embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+        """
+        :param path: The .npz file holding the embeddings and scores of previously evaluated responses.
+        :param threshold: Minimum cosine similarity for a cached score to be reused. Default is 0.95.
+        :param embedding_model: The sentence-transformers model used to embed responses. Default is 'all-MiniLM-L6-v2'.
+        """
+        # Only check that the extra is installed; importing it (and torch) waits until the first embedding
+        if importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError("The semantic evaluator cache requires sentence-transformers. "
+                              "Install it with `pip install needlehaystack[semantic-cache]`.")
+
+        # Resolved now, so a later chdir doesn't move where the index is saved
+        self.path = os.path.abspath(path)
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        # Rows live in growable buffers. Readers only see the (embeddings, scores) snapshot, which add()
+        # replaces in a single assignment, so a lookup never sees an embedding without its score.
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                self._embedding_buffer = data["embeddings"].astype(np.float32)
+                self._score_buffer = data["scores"].astype(np.int64)
+            self._index = (self._embedding_buffer, self._score_buffer)
+        else:
+            self._embedding_buffer = None
+            self._score_buffer = np.empty(0, dtype=np.int64)
+            self._index = None
+
+    def embed(self, response: str) -> np.ndarray:
+        # The embedding model is only loaded once a response actually needs embedding. Concurrent
+        # first lookups all arrive here at once, so the load is locked to happen exactly once.
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.embedding_model)
+        return np.asarray(self._model.encode(response, normalize_embeddings=True), dtype=np.float32)
+
+    def get(self, embedding: np.ndarray) -> Optional[int]:
+        index = self._index
+        if index is None:
+            return None
+
+        # Embeddings are normalized, so the inner product is the cosine similarity
+        embeddings, scores = index
+        similarities = embeddings @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return int(scores[best])
+
+    def add(self, embedding: np.ndarray, score: int):
+        with self._lock:
+            size = 0 if self._index is None else len(self._index[1])
+            if size == len(self._score_buffer):
+                # Double the capacity so appends stay amortized O(1)
+                capacity = max(2 * size, self.SAVE_EVERY)
+                embedding_buffer = np.empty((capacity, embedding.shape[0]), dtype=np.float32)
+                score_buffer = np.empty(capacity, dtype=np.int64)
+                if size:
+                    embedding_buffer[:size] = self._embedding_buffer[:size]
+                    score_buffer[:size] = self._score_buffer[:size]
+                self._embedding_buffer, self._score_buffer = embedding_buffer, score_buffer
+
+            self._embedding_buffer[size] = embedding
+            self._score_buffer[size] = score
+            self._index = (self._embedding_buffer[:size + 1], self._score_buffer[:size + 1])
+
+            self._unsaved += 1
+            if self._unsaved >= self.SAVE_EVERY:
+                self._save()
+
+    def close(self):
+        # Saves the rows added since the last save; call it once the run is done
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _save(self):
+        embeddings, scores = self._index
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, embeddings=embeddings, scores=scores)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
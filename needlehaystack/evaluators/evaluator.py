@@ -1,8 +1,25 @@
-
+import asyncio
 from abc import ABC, abstractmethod
+from typing import Optional
 
 class Evaluator(ABC):
-    CRITERIA: dict[str, str]
-
     @abstractmethod
-    def evaluate_response(self, response: str) -> int: ...
\ No newline at end of file
+    def evaluate_response(self, response: str) -> int: ...
+
+    async def aevaluate_response(self, response: str) -> int:
+        # Evaluators without a native async client fall back to a worker thread
+        # so a blocking request never stalls the event loop driving the test.
+        return await asyncio.to_thread(self.evaluate_response, response)
+
+    async def evaluate_responses(self, responses: list[str], max_concurrency: Optional[int] = None) -> list[int]:
+        sem = asyncio.Semaphore(max_concurrency or len(responses) or 1)
+
+        async def bound_evaluate(response: str) -> int:
+            async with sem:
+                return await self.aevaluate_response(response)
+
+        return await asyncio.gather(*(bound_evaluate(response) for response in responses))
+
+    def close(self):
+        # Evaluators holding caches or connections release them here once the run is done
+        pass
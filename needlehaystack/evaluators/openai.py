@@ -1,28 +1,104 @@
+import asyncio
+import hashlib
+import json
 import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Final, Optional
 
+import httpx
+import numpy as np
+import tiktoken
+
+from .cache import ScoreCache, SemanticScoreCache
 from .evaluator import Evaluator
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-class OpenAIEvaluator(Evaluator):
-    DEFAULT_MODEL_KWARGS: dict = dict(temperature=0)
-    CRITERIA = {"accuracy": """
+_ACCURACY_CRITERIA: Final[str] = """
                 Score 1: The answer is completely unrelated to the reference.
                 Score 3: The answer has minor relevance but does not align with the reference.
                 Score 5: The answer has moderate relevance but contains inaccuracies.
                 Score 7: The answer aligns with the reference but has minor omissions.
                 Score 10: The answer is completely accurate and aligns perfectly with the reference.
-                Only respond with a numberical score"""}
+                Only respond with a numberical score"""
+
+# The evaluator's environment is resolved once per process, so a missing key fails at startup
+# rather than inside a worker, and later evaluators don't repeat the lookups.
+_ENV: dict[str, Optional[str]] = {}
+
+def _load_env_once() -> dict[str, Optional[str]]:
+    if not _ENV:
+        api_key = os.getenv('NIAH_EVALUATOR_API_KEY')
+        if (not api_key):
+            raise ValueError("NIAH_EVALUATOR_API_KEY must be in env for using openai evaluator.")
+        _ENV.update(api_key=api_key,
+                    base_url=os.getenv('BASE_URL'),
+                    cache_ttl=os.getenv('NIAH_EVAL_CACHE_TTL'))
+    return _ENV
+
+# Clients are shared by every evaluator using the same credentials, so the underlying
+# HTTP/2 connection pool (and its TLS sessions) is reused across the whole sweep instead
+# of being rebuilt per evaluator instance.
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+_HTTP_TIMEOUT = 60
+_CLIENTS: dict[tuple[str, str], OpenAI] = {}
+_ASYNC_CLIENTS: dict[tuple[str, str], AsyncOpenAI] = {}
+
+def _get_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    key = (api_key, base_url or "")
+    if key not in _CLIENTS:
+        _CLIENTS[key] = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+        )
+    return _CLIENTS[key]
+
+def _get_async_client(api_key: str, base_url: Optional[str]) -> AsyncOpenAI:
+    key = (api_key, base_url or "")
+    if key not in _ASYNC_CLIENTS:
+        _ASYNC_CLIENTS[key] = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+        )
+    return _ASYNC_CLIENTS[key]
+
+class OpenAIEvaluator(Evaluator):
+    DEFAULT_MODEL: str = "gpt-4o-mini"
+    # Scores are a single token, so streaming would only add SSE framing and extra
+    # choices would only add server-side generation. top_p and seed pin sampling so that
+    # a cached score is the score the API would return again.
+    DEFAULT_MODEL_KWARGS: dict = dict(temperature=0, top_p=0, seed=0, n=1, stream=False)
+    SCORE_CACHE_SIZE: int = 4096
+    # Bump when the scoring request changes in a way its parameters don't capture
+    CACHE_VERSION: int = 1
+    DEFAULT_CACHE_DIR: str = ".niah_eval_cache"
+    DEFAULT_SEMANTIC_CACHE_DIR: str = ".niah_sem_cache"
+    SCORES: dict[str, int] = {"1": 1, "3": 3, "5": 5, "7": 7, "10": 10}
+    UNPARSEABLE_SCORE: int = 0
+    _SCORE_RE = re.compile(r"\b(?:10|[1357])\b")
+    PROMPT_HEAD: str = "Response to Evaluate: "
+    PROMPT_TAIL: str = "\nProvide only a numerical score (1, 3, 5, 7, or 10):"
 
     def __init__(self,
-                 model_name: str = "gpt-4.1-mini",
+                 model_name: str = DEFAULT_MODEL,
                  model_kwargs: dict = DEFAULT_MODEL_KWARGS,
                  true_answer: str = None,
-                 question_asked: str = None,):
+                 question_asked: str = None,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 semantic_cache_dir: Optional[str] = None,
+                 semantic_threshold: float = 0.95,):
         """
-        :param model_name: The name of the model.
-        :param model_kwargs: Model configuration. Default is {temperature: 0}
+        :param model_name: The name of the model. Default is 'gpt-4o-mini'; scoring emits a single token, so a small model is enough.
+        :param model_kwargs: Model configuration. Default is {temperature: 0, top_p: 0, seed: 0, n: 1, stream: False}
         :param true_answer: The true answer to the question asked.
         :param question_asked: The question asked to the model.
+        :param cache_dir: Directory of the on-disk score cache shared across runs. Default is '.niah_eval_cache'. None disables it.
+            Entries older than NIAH_EVAL_CACHE_TTL seconds (if set in env) are ignored.
+        :param semantic_cache_dir: Directory of the semantic cache, which reuses scores of near-identical responses. Default is None, disabled.
+        :param semantic_threshold: Minimum cosine similarity for the semantic cache to reuse a score. Default is 0.95.
         """
 
         if (not true_answer) or (not question_asked):
@@ -33,41 +109,180 @@ class OpenAIEvaluator(Evaluator):
         self.true_answer = true_answer
         self.question_asked = question_asked
 
-        api_key = os.getenv('NIAH_EVALUATOR_API_KEY')
-        if (not api_key):
-            raise ValueError("NIAH_EVALUATOR_API_KEY must be in env for using openai evaluator.")
+        env = _load_env_once()
+        self.logit_bias = self._build_logit_bias(env['base_url'])
 
-        self.api_key = api_key
-        base_url = os.getenv('BASE_URL')
-        
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=base_url
-        )
+        # Everything except the response is fixed for the sweep, so it lives in the system
+        # message where provider-side prompt caching can match it as a shared prefix.
+        self.system_prompt = f"""
+        Compare the response provided by the user to the reference answer and score it based on accuracy:
 
-    def evaluate_response(self, response: str) -> int:
-        prompt = f"""
-        Compare the following response to the reference answer and score it based on accuracy:
-        
         Question: {self.question_asked}
         Reference Answer: {self.true_answer}
-        Response to Evaluate: {response}
-        
-        {self.CRITERIA['accuracy']}
-        
-        Provide only a numerical score (1, 3, 5, 7, or 10):
+
+        {_ACCURACY_CRITERIA}
         """
-        
+        self._system_message = {"role": "system", "content": self.system_prompt}
+
+        if self.logit_bias:
+            # Every allowed score is a single token, so one decode step is enough.
+            output_kwargs = dict(logit_bias=self.logit_bias, max_tokens=1)
+        else:
+            output_kwargs = dict(max_tokens=10)
+        self._request_kwargs = {**self.model_kwargs, "model": self.model_name, **output_kwargs}
+
+        # A score depends only on the request, so identical responses are scored once: first from
+        # memory, then from the on-disk cache of earlier runs. The key covers the model, every request
+        # parameter and the prompt (hence question_asked and true_answer), so changing any of them
+        # invalidates cached scores. The static part is hashed once and the hasher copied per response.
+        self._cache_key_hasher = hashlib.blake2b("\0".join((
+            str(self.CACHE_VERSION),
+            json.dumps(self._request_kwargs, sort_keys=True, default=str),
+            self.system_prompt,
+            self.PROMPT_HEAD,
+            self.PROMPT_TAIL,
+            "")).encode(), digest_size=20)
+        self._score_cache: OrderedDict[bytes, int] = OrderedDict()
+        # Cache steps may run in worker threads when the semantic cache is enabled
+        self._score_cache_lock = threading.Lock()
+        if cache_dir:
+            ttl = env['cache_ttl']
+            self.persistent_cache = ScoreCache(cache_dir, ttl=float(ttl) if ttl else None)
+        else:
+            self.persistent_cache = None
+        if semantic_cache_dir:
+            digest = self._cache_key_hasher.hexdigest()
+            self.semantic_cache = SemanticScoreCache(os.path.join(semantic_cache_dir, f"{digest}.npz"),
+                                                     threshold=semantic_threshold)
+        else:
+            self.semantic_cache = None
+
+        self.api_key = env['api_key']
+        base_url = env['base_url']
+
+        self.client = _get_client(self.api_key, base_url)
+        self.aclient = _get_async_client(self.api_key, base_url)
+
+    def evaluate_response(self, response: str) -> int:
+        key, embedding, score = self._lookup_score(response)
+        if score is not None:
+            return score
+
+        eval_response = self.client.chat.completions.create(**self._completion_kwargs(response))
+        return self._finish(key, embedding, eval_response)
+
+    async def aevaluate_response(self, response: str) -> int:
+        """
+        Non-blocking variant of `evaluate_response`, so that many evaluations can be
+        in flight at once when gathered by the tester.
+        """
+        key, embedding, score = await self._run_cache_step(self._lookup_score, response)
+        if score is not None:
+            return score
+
+        eval_response = await self.aclient.chat.completions.create(**self._completion_kwargs(response))
+        return await self._run_cache_step(self._finish, key, embedding, eval_response)
+
+    def close(self):
+        # Flushes the semantic index and closes the score database
+        if self.persistent_cache:
+            self.persistent_cache.close()
+        if self.semantic_cache:
+            self.semantic_cache.close()
+
+    async def _run_cache_step(self, func, *args):
+        # The semantic cache embeds with a local model (loading it on first use) and writes its index
+        # to disk, so with it enabled cache steps run in a worker thread instead of stalling the event loop.
+        if self.semantic_cache:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _lookup_score(self, response: str) -> tuple[bytes, Optional[np.ndarray], Optional[int]]:
+        key = self._cache_key(response)
+        score = self._get_cached_score(key)
+        if score is not None or not self.semantic_cache:
+            return key, None, score
+
+        embedding = self.semantic_cache.embed(response)
+        score = self.semantic_cache.get(embedding)
+        if score is not None:
+            # Semantic hits are only remembered in memory; the on-disk cache stays exact
+            self._remember_score(key, score)
+        return key, embedding, score
+
+    def _finish(self, key: bytes, embedding: Optional[np.ndarray], eval_response) -> int:
+        # Shared tail of the sync and async paths: parse the reply and cache any real score
+        score = self._parse_score(eval_response)
+        if score != self.UNPARSEABLE_SCORE:
+            self._cache_score(key, embedding, score)
+        return score
+
+    def _cache_key(self, response: str) -> bytes:
+        hasher = self._cache_key_hasher.copy()
+        hasher.update(response.encode())
+        return hasher.digest()
+
+    def _get_cached_score(self, key: bytes) -> Optional[int]:
+        with self._score_cache_lock:
+            score = self._score_cache.get(key)
+            if score is not None:
+                self._score_cache.move_to_end(key)
+                return score
+
+        if self.persistent_cache:
+            score = self.persistent_cache.get(key)
+            if score is not None:
+                self._remember_score(key, score)
+        return score
+
+    def _cache_score(self, key: bytes, embedding: Optional[np.ndarray], score: int):
+        self._remember_score(key, score)
+        if self.persistent_cache:
+            self.persistent_cache.set(key, score)
+        if embedding is not None:
+            self.semantic_cache.add(embedding, score)
+
+    def _remember_score(self, key: bytes, score: int):
+        with self._score_cache_lock:
+            self._score_cache[key] = score
+            if len(self._score_cache) > self.SCORE_CACHE_SIZE:
+                self._score_cache.popitem(last=False)
+
+    def _completion_kwargs(self, response: str) -> dict:
+        # Only the response varies per call; the rest of the request is assembled in __init__.
+        user_message = {"role": "user", "content": self.PROMPT_HEAD + response + self.PROMPT_TAIL}
+        return dict(self._request_kwargs, messages=[self._system_message, user_message])
+
+    def _parse_score(self, eval_response) -> int:
+        """
+        Maps the evaluator's reply to a score. Replies that are not exactly a score fall back to
+        the first standalone allowed score in the text, and to UNPARSEABLE_SCORE when there is
+        none, so a malformed reply is never mistaken for a genuine score of 1.
+        """
+        score_text = (eval_response.choices[0].message.content or "").strip()
+        score = self.SCORES.get(score_text)
+        if score is None:
+            match = self._SCORE_RE.search(score_text)
+            score = int(match.group(0)) if match else self.UNPARSEABLE_SCORE
+        return score
+
+    def _build_logit_bias(self, base_url: Optional[str]) -> Optional[dict[str, int]]:
+        """
+        Restricts the evaluator's output to the allowed scores. Only applied against the OpenAI API,
+        whose token ids are the ones tiktoken knows, when the tokenizer loads and every score encodes
+        to exactly one token; otherwise a multi-token score such as "10" could be truncated by
+        max_tokens=1. The bias is only an optimization, so any failure to build it falls back to
+        max_tokens=10.
+        """
+        if base_url:
+            return None
         try:
-            eval_response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=10,
-                temperature=0
-            )
-            
-            score_text = eval_response.choices[0].message.content.strip()
-            return int(score_text)
-        except Exception as e:
-            print(f"Error evaluating response: {e}")
-            return 1
+            # Downloads the encoding on first use, which fails offline or behind a proxy
+            encoding = tiktoken.encoding_for_model(self.model_name)
+        except Exception:
+            return None
+
+        token_ids = [encoding.encode(score_text) for score_text in self.SCORES]
+        if any(len(ids) != 1 for ids in token_ids):
+            return None
+        return {str(ids[0]): 100 for ids in token_ids}
@@ -3,7 +3,6 @@ import glob
 import json
 import os
 import time
-from asyncio import Semaphore
 from datetime import datetime, timezone
 
 import numpy as np
@@ -145,8 +144,9 @@ class LLMMultiNeedleHaystackTester(LLMNeedleHaystackTester):
         Returns:
             str: The context with needles inserted.
         """
-        context = self.read_context_files()
-        context = self.encode_and_trim(context, context_length)
+        # Blocking file IO and tokenization run in a worker thread so other grid cells keep progressing
+        context = await asyncio.to_thread(self.read_context_files)
+        context = await asyncio.to_thread(self.encode_and_trim, context, context_length)
         context = await self.insert_needles(context, depth_percent, context_length)
         return context
     
@@ -165,6 +165,11 @@ class LLMMultiNeedleHaystackTester(LLMNeedleHaystackTester):
         # Go generate the required length context and place your needle statement in
         context = await self.generate_context(context_length, depth_percent)
 
+        # Wait for the rate limiter before timing, so queueing isn't counted as model latency.
+        # Only the model call below is throttled; the LangSmith path runs its own dataset.
+        if self.rate_limiter and self.evaluator.__class__.__name__ != "LangSmithEvaluator":
+            await self.rate_limiter.acquire()
+
         test_start_time = time.time()
 
         # LangSmith
@@ -183,7 +188,7 @@ class LLMMultiNeedleHaystackTester(LLMNeedleHaystackTester):
             # Go see if the model can answer the question to pull out your random fact
             response = await self.model_to_test.evaluate_model(prompt)
             # Compare the reponse to the actual needle you placed
-            score = self.evaluation_model.evaluate_response(response)
+            score = await self.evaluator.aevaluate_response(response)
 
             test_end_time = time.time()
             test_elapsed_time = test_end_time - test_start_time
@@ -232,26 +237,6 @@ class LLMMultiNeedleHaystackTester(LLMNeedleHaystackTester):
                 with open(f'results/{context_file_location}_results.json', 'w') as f:
                     json.dump(results, f)
 
-            if self.seconds_to_sleep_between_completions:
-                await asyncio.sleep(self.seconds_to_sleep_between_completions)
-
-    async def bound_evaluate_and_log(self, sem, *args):
-            async with sem:
-                await self.evaluate_and_log(*args)
-
-    async def run_test(self):
-        sem = Semaphore(self.num_concurrent_requests)
-
-        # Run through each iteration of context_lengths and depths
-        tasks = []
-        for context_length in self.context_lengths:
-            for depth_percent in self.document_depth_percents:
-                task = self.bound_evaluate_and_log(sem, context_length, depth_percent)
-                tasks.append(task)
-
-        # Wait for all tasks to complete
-        await asyncio.gather(*tasks)
-
     def print_start_test_summary(self):
         print ("\n")
         print ("Starting Needle In A Haystack Testing...")
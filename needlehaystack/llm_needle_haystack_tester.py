@@ -5,6 +5,7 @@ import os
 import time
 
 import numpy as np
+from aiolimiter import AsyncLimiter
 
 from .evaluators import Evaluator
 from .providers import ModelProvider
@@ -59,7 +60,7 @@ class LLMNeedleHaystackTester:
         :param document_depth_percent_intervals: The number of intervals for the document depth percent. Default is 35.
         :param document_depth_percents: The depth percentages of the document. Default is None.
         :param document_depth_percent_interval_type: The type of interval for the document depth percent. Must be either 'linear' or 'sigmoid'. Default is 'linear'.
-        :param seconds_to_sleep_between_completions: The number of seconds to sleep between completions. Default is None.
+        :param seconds_to_sleep_between_completions: Rate limit for completions: at most num_concurrent_requests completions start per this many seconds, shared across all in-flight requests. Default is None, no limit.
         :param print_ongoing_status: Whether or not to print the ongoing status. Default is True.
         :param kwargs: Additional arguments.
         """
@@ -77,8 +78,15 @@ class LLMNeedleHaystackTester:
         self.final_context_length_buffer = final_context_length_buffer
         self.save_contexts = save_contexts
         self.seconds_to_sleep_between_completions = seconds_to_sleep_between_completions
+        # A token bucket shared by all workers replaces the per-worker sleep after each completion,
+        # so the budget is spent across in-flight requests instead of being paid sequentially.
+        if seconds_to_sleep_between_completions:
+            self.rate_limiter = AsyncLimiter(num_concurrent_requests, seconds_to_sleep_between_completions)
+        else:
+            self.rate_limiter = None
         self.print_ongoing_status = print_ongoing_status
         self.testing_results = []
+        self.failed_tests = []
 
         if context_lengths is None:
             if context_lengths_min is None or context_lengths_max is None or context_lengths_num_intervals is None:
@@ -118,12 +126,19 @@ class LLMNeedleHaystackTester:
     def sigmoid(self, x):
         return 1 / (1 + np.exp(-x))
     
-    async def bound_evaluate_and_log(self, sem, *args):
+    async def bound_evaluate_and_log(self, sem, context_length, depth_percent):
         async with sem:
-            await self.evaluate_and_log(*args)
+            try:
+                await self.evaluate_and_log(context_length, depth_percent)
+            except Exception as e:
+                # A failed test must not cancel the rest of the sweep. It writes no result file,
+                # so it is retried on the next run.
+                print(f"Error testing context length {context_length} at depth {depth_percent}%: {e!r}")
+                self.failed_tests.append((context_length, depth_percent))
 
     async def run_test(self):
         sem = Semaphore(self.num_concurrent_requests)
+        self.failed_tests = []
 
         # Run through each iteration of context_lengths and depths
         tasks = []
@@ -135,6 +150,11 @@ class LLMNeedleHaystackTester:
         # Wait for all tasks to complete
         await asyncio.gather(*tasks)
 
+        if self.failed_tests:
+            print(f"{len(self.failed_tests)} test(s) failed and will be retried on the next run:")
+            for context_length, depth_percent in self.failed_tests:
+                print(f"- Context: {context_length} tokens, Depth: {depth_percent}%")
+
     async def evaluate_and_log(self, context_length, depth_percent):
         # Checks to see if you've already checked a length/percent/version.
         # This helps if the program stop running and you want to restart later
@@ -148,6 +168,10 @@ class LLMNeedleHaystackTester:
         # Prepare your message to send to the model you're going to evaluate
         prompt = self.model_to_test.generate_prompt(context, self.retrieval_question)
 
+        # Wait for the rate limiter before timing, so queueing isn't counted as model latency
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+
         test_start_time = time.time()
 
         # Go see if the model can answer the question to pull out your random fact
@@ -157,7 +181,7 @@ class LLMNeedleHaystackTester:
         test_elapsed_time = test_end_time - test_start_time
 
         # Compare the reponse to the actual needle you placed
-        score = self.evaluation_model.evaluate_response(response)
+        score = await self.evaluation_model.aevaluate_response(response)
 
         results = {
             # 'context' : context, # Uncomment this line if you'd like to save the context the model was asked to retrieve from. Warning: This will become very large.
@@ -203,9 +227,6 @@ class LLMNeedleHaystackTester:
             with open(f'results/{context_file_location}_results.json', 'w') as f:
                 json.dump(results, f)
 
-        if self.seconds_to_sleep_between_completions:
-            await asyncio.sleep(self.seconds_to_sleep_between_completions)
-
     def result_exists(self, context_length, depth_percent):
         """
         Checks to see if a result has already been evaluated or not
@@ -228,8 +249,11 @@ class LLMNeedleHaystackTester:
         return False
 
     async def generate_context(self, context_length, depth_percent):
-        # Load up tiktoken so we navigate tokens more easily
+        # Reading the haystack and tokenizing it is blocking work, so it runs in a worker thread.
+        # That way the other grid cells' API calls keep progressing while this context is built.
+        return await asyncio.to_thread(self.build_context, context_length, depth_percent)
 
+    def build_context(self, context_length, depth_percent):
         # Get your haystack dir files loaded into a string
         context = self.read_context_files()
 
@@ -1,4 +1,13 @@
-from .anthropic import Anthropic
-from .cohere import Cohere
+from importlib import import_module
+
 from .model import ModelProvider
-from .openai import OpenAI
+
+# Concrete providers pull in their vendor SDKs and LangChain, so they are only imported on first access.
+_PROVIDER_MODULES = {"Anthropic": ".anthropic", "Cohere": ".cohere", "OpenAI": ".openai"}
+
+__all__ = ["Anthropic", "Cohere", "ModelProvider", "OpenAI"]
+
+def __getattr__(name):
+    if name in _PROVIDER_MODULES:
+        return getattr(import_module(_PROVIDER_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,8 @@
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Callable, Optional
 
-from dotenv import load_dotenv
-from jsonargparse import CLI
-
-from needlehaystack import LLMNeedleHaystackTester, LLMMultiNeedleHaystackTester
-from needlehaystack.evaluators import Evaluator, LangSmithEvaluator, OpenAIEvaluator
-from needlehaystack.providers import Anthropic, ModelProvider, OpenAI, Cohere
-
-load_dotenv()
+from needlehaystack.evaluators import Evaluator
+from needlehaystack.providers import ModelProvider
 
 @dataclass
 class CommandArgs():
@@ -34,7 +28,7 @@ class CommandArgs():
     - document_depth_percent_intervals: The number of iterations to do between your min/max points
     - document_depth_percents: A custom set of document depths lengths. This will override the values set for document_depth_percent_min, max, and intervals if set
     - document_depth_percent_interval_type: Determines the distribution of depths to iterate over. 'linear' or 'sigmoid'
-    - seconds_to_sleep_between_completions: Default: None, set # of seconds if you'd like to slow down your requests
+    - seconds_to_sleep_between_completions: Default: None, set # of seconds if you'd like to slow down your requests. At most num_concurrent_requests completions start per this many seconds, i.e. a rate of num_concurrent_requests / seconds_to_sleep_between_completions requests per second shared by all workers
     - print_ongoing_status: Default: True, whether or not to print the status of test as they complete
     
     LLMMultiNeedleHaystackTester parameters:
@@ -48,7 +42,10 @@ class CommandArgs():
     provider: str = "openai"  # The provider of the model, available options are openai, anthropic, and cohere
     evaluator: str = "openai"  # The evaluator, which can either be a model or LangSmith
     model_name: str = "gpt-4.1-mini"  # Model name of the language model accessible by the provider
-    evaluator_model_name: Optional[str] = "gpt-4.1-mini"  # Model name of the language model accessible by the evaluator
+    evaluator_model_name: Optional[str] = "gpt-4o-mini"  # Model name of the language model accessible by the evaluator. Scoring is a single token, so a small model is enough
+    eval_cache: Optional[bool] = True  # Whether to reuse evaluator scores persisted in .niah_eval_cache/ by earlier runs. Pass --eval_cache false to disable
+    semantic_eval_cache: Optional[bool] = False  # Whether to reuse evaluator scores of near-identical responses, stored in .niah_sem_cache/. Requires the semantic-cache extra
+    semantic_threshold: Optional[float] = 0.95  # Minimum cosine similarity between responses for the semantic cache to reuse a score
     needle: Optional[str] = "\nThe best thing to do in San Francisco is eat a sandwich and sit in Dolores Park on a sunny day.\n"  # The statement or fact which will be placed in your context ('haystack')
     haystack_dir: Optional[str] = "PaulGrahamEssays"  # The directory which contains the text files to load as background context
     retrieval_question: Optional[str] = "What is the best thing to do in San Francisco?"  # The question with which to retrieve your needle in the background context
@@ -66,7 +63,7 @@ class CommandArgs():
     save_results: Optional[bool] = True  # Whether or not you'd like to save your results to file
     save_contexts: Optional[bool] = True  # Whether or not you'd like to save your contexts to file. Warning these will get very long
     final_context_length_buffer: Optional[int] = 200  # The amount of context to take off each input to account for system messages and output tokens
-    seconds_to_sleep_between_completions: Optional[float] = None  # Default: None, set # of seconds if you'd like to slow down your requests
+    seconds_to_sleep_between_completions: Optional[float] = None  # Default: None, set # of seconds if you'd like to slow down your requests. Allows num_concurrent_requests completions per this many seconds
     print_ongoing_status: Optional[bool] = True  # Default: True, whether or not to print the status of test as they complete
     eval_set: Optional[str] = "multi-needle-eval-pizza-3"  # LangSmith evaluation set name
     multi_needle: Optional[bool] = False  # True or False, whether to run multi-needle
@@ -76,6 +73,44 @@ class CommandArgs():
         " Goat cheese is one of the secret ingredients needed to build the perfect pizza. "
     ])
 
+def _openai_provider(args: CommandArgs) -> ModelProvider:
+    from needlehaystack.providers import OpenAI
+    return OpenAI(model_name=args.model_name)
+
+def _anthropic_provider(args: CommandArgs) -> ModelProvider:
+    from needlehaystack.providers import Anthropic
+    return Anthropic(model_name=args.model_name)
+
+def _cohere_provider(args: CommandArgs) -> ModelProvider:
+    from needlehaystack.providers import Cohere
+    return Cohere(model_name=args.model_name)
+
+def _openai_evaluator(args: CommandArgs) -> Evaluator:
+    from needlehaystack.evaluators import OpenAIEvaluator
+    return OpenAIEvaluator(model_name=args.evaluator_model_name,
+                           question_asked=args.retrieval_question,
+                           true_answer=args.needle,
+                           cache_dir=OpenAIEvaluator.DEFAULT_CACHE_DIR if args.eval_cache else None,
+                           semantic_cache_dir=OpenAIEvaluator.DEFAULT_SEMANTIC_CACHE_DIR if args.semantic_eval_cache else None,
+                           semantic_threshold=args.semantic_threshold)
+
+def _langsmith_evaluator(args: CommandArgs) -> Evaluator:
+    from needlehaystack.evaluators import LangSmithEvaluator
+    return LangSmithEvaluator()
+
+# Factories import their provider or evaluator on first call, so a run only loads the SDK it actually uses.
+# New providers and evaluators can be registered here without touching the dispatch below.
+_PROVIDERS: dict[str, Callable[[CommandArgs], ModelProvider]] = {
+    "openai": _openai_provider,
+    "anthropic": _anthropic_provider,
+    "cohere": _cohere_provider,
+}
+
+_EVALUATORS: dict[str, Callable[[CommandArgs], Evaluator]] = {
+    "openai": _openai_evaluator,
+    "langsmith": _langsmith_evaluator,
+}
+
 def get_model_to_test(args: CommandArgs) -> ModelProvider:
     """
     Determines and returns the appropriate model provider based on the provided command arguments.
@@ -89,15 +124,11 @@ def get_model_to_test(args: CommandArgs) -> ModelProvider:
     Raises:
         ValueError: If the specified provider is not supported.
     """
-    match args.provider.lower():
-        case "openai":
-            return OpenAI(model_name=args.model_name)
-        case "anthropic":
-            return Anthropic(model_name=args.model_name)
-        case "cohere":
-            return Cohere(model_name=args.model_name)
-        case _:
-            raise ValueError(f"Invalid provider: {args.provider}")
+    try:
+        factory = _PROVIDERS[args.provider.lower()]
+    except KeyError:
+        raise ValueError(f"Invalid provider: {args.provider}") from None
+    return factory(args)
 
 def get_evaluator(args: CommandArgs) -> Evaluator:
     """
@@ -112,15 +143,11 @@ def get_evaluator(args: CommandArgs) -> Evaluator:
     Raises:
         ValueError: If the specified evaluator is not supported.
     """
-    match args.evaluator.lower():
-        case "openai":
-            return OpenAIEvaluator(model_name=args.evaluator_model_name,
-                                   question_asked=args.retrieval_question,
-                                   true_answer=args.needle)
-        case "langsmith":
-            return LangSmithEvaluator()
-        case _:
-            raise ValueError(f"Invalid evaluator: {args.evaluator}")
+    try:
+        factory = _EVALUATORS[args.evaluator.lower()]
+    except KeyError:
+        raise ValueError(f"Invalid evaluator: {args.evaluator}") from None
+    return factory(args)
 
 def main():
     """
@@ -129,17 +156,31 @@ def main():
     It parses the command line arguments, selects the appropriate model provider and evaluator,
     and initiates the testing process either for single-needle or multi-needle scenarios.
     """
+    from dotenv import load_dotenv
+    from jsonargparse import CLI
+
+    load_dotenv()
     args = CLI(CommandArgs, as_positional=False)
+    if args.evaluator.lower() == "openai":
+        # Resolve the evaluator's env up front so a missing key fails before anything else is set up
+        from needlehaystack.evaluators.openai import _load_env_once
+        _load_env_once()
     args.model_to_test = get_model_to_test(args)
     args.evaluator = get_evaluator(args)
     
     if args.multi_needle == True:
         print("Testing multi-needle")
+        from needlehaystack import LLMMultiNeedleHaystackTester
         tester = LLMMultiNeedleHaystackTester(**args.__dict__)
     else: 
         print("Testing single-needle")
+        from needlehaystack import LLMNeedleHaystackTester
         tester = LLMNeedleHaystackTester(**args.__dict__)
-    tester.start_test()
+    try:
+        tester.start_test()
+    finally:
+        if isinstance(args.evaluator, Evaluator):
+            args.evaluator.close()
 
 if __name__ == "__main__":
     main()
@@ -14,6 +14,9 @@ setup(
     install_requires=[
         x for x in open("./requirements.txt", "r+").readlines() if x.strip()
     ],
+    extras_require={
+        'semantic-cache': ['sentence-transformers'],
+    },
     python_requires='>=3.6',
     classifiers=[],
     entry_points={
@@ -1,29 +1,424 @@
-from unittest.mock import patch, MagicMock, call, ANY
+import asyncio
+import importlib.machinery
+import sys
+import time
+import types
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import httpx
+import numpy as np
+import pytest
+import requests
+from openai import APIConnectionError
 
 from needlehaystack.evaluators import OpenAIEvaluator
+from needlehaystack.evaluators import openai as openai_evaluator
 
 QUESTION_ASKED = "What is the color of the sky?"
 QUESTION_ANSWER = "Sky is blue"
 API_KEY = "abc"
-SCORE = 123
+SCORE = 7
 TEMPERATURE = 0
-MODEL = "gpt-4.1-mini"
+MODEL = "gpt-4o-mini"
+SCORE_TOKENS = {"1": [16], "3": [18], "5": [20], "7": [22], "10": [702]}
 
 
-@patch('needlehaystack.evaluators.openai.ChatOpenAI')
-@patch('needlehaystack.evaluators.openai.load_evaluator')
-def test_openai(mock_load_evaluator, mock_chat_open_ai, monkeypatch):
-    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def clear_module_state():
+    for cache in (openai_evaluator._ENV, openai_evaluator._CLIENTS, openai_evaluator._ASYNC_CLIENTS):
+        cache.clear()
+    yield
+    for cache in (openai_evaluator._ENV, openai_evaluator._CLIENTS, openai_evaluator._ASYNC_CLIENTS):
+        cache.clear()
+
 
-    mock_evaluator = MagicMock()
-    mock_evaluator.evaluate_strings.return_value = {'score': str(SCORE)}
+@pytest.fixture(autouse=True)
+def mock_encoding():
+    with patch('needlehaystack.evaluators.openai.tiktoken.encoding_for_model') as mock_encoding_for_model:
+        mock_encoding_for_model.return_value.encode.side_effect = lambda text: SCORE_TOKENS[text]
+        yield mock_encoding_for_model
 
-    mock_load_evaluator.return_value = mock_evaluator
+
+def completion(content):
+    message = MagicMock()
+    message.content = content
+    choice = MagicMock()
+    choice.message = message
+    result = MagicMock()
+    result.choices = [choice]
+    return result
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion(str(SCORE))
 
     evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
     result = evaluator.evaluate_response("Something")
 
-    assert mock_chat_open_ai.call_args == call(model=MODEL, temperature=TEMPERATURE, openai_api_key=API_KEY)
-    assert mock_load_evaluator.call_args == call('labeled_score_string', criteria=OpenAIEvaluator.CRITERIA, llm=ANY)
+    assert mock_openai.call_args.kwargs['api_key'] == API_KEY
+    assert mock_create.call_args.kwargs['model'] == MODEL
+    assert mock_create.call_args.kwargs['temperature'] == TEMPERATURE
+    assert mock_create.call_args.kwargs['stream'] is False
+    assert mock_create.call_args.kwargs['n'] == 1
+    assert mock_create.call_args.kwargs['top_p'] == 0
+    assert mock_create.call_args.kwargs['seed'] == 0
+
+    system_message, user_message = mock_create.call_args.kwargs['messages']
+    assert system_message == {"role": "system", "content": evaluator.system_prompt}
+    assert QUESTION_ASKED in system_message['content'] and QUESTION_ANSWER in system_message['content']
+    assert user_message['role'] == "user" and "Something" in user_message['content']
 
     assert result == SCORE
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_async(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = AsyncMock(side_effect=[completion("10"), completion("3")])
+    mock_async_openai.return_value.chat.completions.create = mock_create
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    results = asyncio.run(evaluator.evaluate_responses(["Blue", "Green"], max_concurrency=2))
+
+    assert mock_create.await_count == 2
+    assert not mock_openai.return_value.chat.completions.create.called
+    assert results == [10, 3]
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_caches_repeated_responses(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion(str(SCORE))
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    results = [evaluator.evaluate_response("I don't know") for _ in range(3)]
+
+    assert mock_create.call_count == 1
+    assert results == [SCORE] * 3
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_shares_clients(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    first = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    second = OpenAIEvaluator(question_asked="Another question?", true_answer=QUESTION_ANSWER)
+
+    assert mock_openai.call_count == 1
+    assert mock_async_openai.call_count == 1
+    assert first.client is second.client
+    assert first.aclient is second.aclient
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_restricts_output_to_scores(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion("10")
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    result = evaluator.evaluate_response("Blue")
+
+    assert mock_create.call_args.kwargs['max_tokens'] == 1
+    assert mock_create.call_args.kwargs['logit_bias'] == {"16": 100, "18": 100, "20": 100, "22": 100, "702": 100}
+    assert result == 10
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_skips_logit_bias_for_multi_token_scores(mock_openai, mock_async_openai, mock_encoding, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+    mock_encoding.return_value.encode.side_effect = lambda text: [16, 15] if text == "10" else SCORE_TOKENS[text]
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion("10")
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    result = evaluator.evaluate_response("Blue")
+
+    assert 'logit_bias' not in mock_create.call_args.kwargs
+    assert mock_create.call_args.kwargs['max_tokens'] == 10
+    assert result == 10
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_skips_logit_bias_when_tokenizer_unavailable(mock_openai, mock_async_openai, mock_encoding, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+    # tiktoken downloads the encoding on first use, which fails offline
+    mock_encoding.side_effect = requests.exceptions.ConnectionError("offline")
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion("10")
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    result = evaluator.evaluate_response("Blue")
+
+    assert 'logit_bias' not in mock_create.call_args.kwargs
+    assert mock_create.call_args.kwargs['max_tokens'] == 10
+    assert result == 10
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_skips_logit_bias_for_custom_base_url(mock_openai, mock_async_openai, mock_encoding, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+    monkeypatch.setenv('BASE_URL', "http://localhost:8000/v1")
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion("10")
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+    evaluator.evaluate_response("Blue")
+
+    mock_encoding.assert_not_called()
+    assert 'logit_bias' not in mock_create.call_args.kwargs
+    assert mock_create.call_args.kwargs['max_tokens'] == 10
+
+
+@pytest.mark.parametrize("score_text, expected", [
+    (" 7\n", 7),
+    ("Score: 10.", 10),
+    ("I'd say 3", 3),
+    ("100", 0),
+    ("N/A", 0),
+])
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_parses_score(mock_openai, mock_async_openai, score_text, expected, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_openai.return_value.chat.completions.create.return_value = completion(score_text)
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+
+    assert evaluator.evaluate_response("Blue") == expected
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_raises_api_errors(mock_openai, mock_async_openai, monkeypatch, capsys):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    error = APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+    mock_openai.return_value.chat.completions.create.side_effect = error
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+
+    with pytest.raises(APIConnectionError):
+        evaluator.evaluate_response("Blue")
+    # Reporting is left to the caller, so a failed test logs its error once
+    assert capsys.readouterr().out == ""
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_persists_scores_across_runs(mock_openai, mock_async_openai, tmp_path, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion(str(SCORE))
+
+    first_run = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path / "cache"))
+    second_run = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path / "cache"))
+    uncached = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=None)
+
+    assert first_run.evaluate_response("Blue") == SCORE
+    assert second_run.evaluate_response("Blue") == SCORE
+    assert mock_create.call_count == 1
+
+    assert uncached.evaluate_response("Blue") == SCORE
+    assert mock_create.call_count == 2
+
+
+@pytest.fixture
+def mock_sentence_transformers():
+    # Refusals share one direction, everything else is orthogonal to them
+    embeddings = {
+        "I don't know": [1.0, 0.0],
+        "I do not know": [0.99, 0.141],
+        "Blue": [0.0, 1.0],
+    }
+    module = types.ModuleType("sentence_transformers")
+    module.__spec__ = importlib.machinery.ModuleSpec("sentence_transformers", None)
+    module.SentenceTransformer = MagicMock()
+    module.SentenceTransformer.return_value.encode.side_effect = lambda text, normalize_embeddings: np.array(embeddings[text])
+    with patch.dict(sys.modules, {"sentence_transformers": module}):
+        yield module
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_semantic_cache(mock_openai, mock_async_openai, mock_sentence_transformers, tmp_path, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.side_effect = [completion("1"), completion("10")]
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER,
+                                cache_dir=None, semantic_cache_dir=str(tmp_path / "semantic"))
+
+    assert evaluator.evaluate_response("I don't know") == 1
+    assert evaluator.evaluate_response("I do not know") == 1
+    assert mock_create.call_count == 1
+
+    assert evaluator.evaluate_response("Blue") == 10
+    assert mock_create.call_count == 2
+
+    evaluator.close()
+    rerun = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER,
+                            cache_dir=None, semantic_cache_dir=str(tmp_path / "semantic"))
+    assert rerun.evaluate_response("I do not know") == 1
+    assert mock_create.call_count == 2
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_cache_key_covers_request_params(mock_openai, mock_async_openai, tmp_path, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion(str(SCORE))
+
+    default = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path))
+    other_seed = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path),
+                                 model_kwargs=dict(OpenAIEvaluator.DEFAULT_MODEL_KWARGS, seed=1))
+    other_model = OpenAIEvaluator(model_name="gpt-4.1-mini", question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER,
+                                  cache_dir=str(tmp_path))
+
+    for evaluator in (default, other_seed, other_model):
+        evaluator.evaluate_response("Blue")
+
+    assert mock_create.call_count == 3
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_requires_api_key(mock_openai, mock_async_openai, monkeypatch):
+    monkeypatch.delenv('NIAH_EVALUATOR_API_KEY', raising=False)
+
+    with pytest.raises(ValueError):
+        OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER)
+
+
+@patch('needlehaystack.evaluators.cache.time.time')
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_persistent_cache_expires_after_ttl(mock_openai, mock_async_openai, mock_time, tmp_path, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+    monkeypatch.setenv('NIAH_EVAL_CACHE_TTL', "60")
+
+    mock_create = mock_openai.return_value.chat.completions.create
+    mock_create.return_value = completion(str(SCORE))
+
+    mock_time.return_value = 1000.0
+    OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path)).evaluate_response("Blue")
+
+    mock_time.return_value = 1059.0
+    OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path)).evaluate_response("Blue")
+    assert mock_create.call_count == 1
+
+    mock_time.return_value = 1061.0
+    OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER, cache_dir=str(tmp_path)).evaluate_response("Blue")
+    assert mock_create.call_count == 2
+
+
+@patch('needlehaystack.evaluators.openai.AsyncOpenAI')
+@patch('needlehaystack.evaluators.openai.OpenAI')
+def test_openai_semantic_cache_runs_off_event_loop(mock_openai, mock_async_openai, mock_sentence_transformers, tmp_path, monkeypatch):
+    monkeypatch.setenv('NIAH_EVALUATOR_API_KEY', API_KEY)
+
+    mock_async_openai.return_value.chat.completions.create = AsyncMock(return_value=completion("1"))
+
+    evaluator = OpenAIEvaluator(question_asked=QUESTION_ASKED, true_answer=QUESTION_ANSWER,
+                                cache_dir=None, semantic_cache_dir=str(tmp_path / "semantic"))
+    # The embedding model is only loaded by the first lookup
+    mock_sentence_transformers.SentenceTransformer.assert_not_called()
+
+    loop_thread = []
+    encode = mock_sentence_transformers.SentenceTransformer.return_value.encode
+    embed = encode.side_effect
+    encode.side_effect = lambda text, normalize_embeddings: loop_thread.append(_in_event_loop()) or embed(text, normalize_embeddings)
+
+    assert asyncio.run(evaluator.evaluate_responses(["I don't know", "I do not know"], max_concurrency=1)) == [1, 1]
+    assert loop_thread == [False, False]
+    evaluator.close()
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def test_semantic_cache_batches_writes(mock_sentence_transformers, tmp_path):
+    from needlehaystack.evaluators.cache import SemanticScoreCache
+
+    path = str(tmp_path / "index.npz")
+    cache = SemanticScoreCache(path)
+    cache.SAVE_EVERY = 3
+
+    cache.add(np.array([1.0, 0.0], dtype=np.float32), 1)
+    cache.add(np.array([0.0, 1.0], dtype=np.float32), 10)
+    assert not (tmp_path / "index.npz").exists()
+    assert cache.get(np.array([0.0, 1.0], dtype=np.float32)) == 10
+
+    cache.add(np.array([0.6, 0.8], dtype=np.float32), 5)
+    with np.load(path) as data:
+        assert list(data["scores"]) == [1, 10, 5]
+
+    cache.add(np.array([0.8, 0.6], dtype=np.float32), 7)
+    cache.close()
+    reloaded = SemanticScoreCache(path)
+    assert reloaded.get(np.array([0.8, 0.6], dtype=np.float32)) == 7
+    assert reloaded.get(np.array([1.0, 0.0], dtype=np.float32)) == 1
+
+
+def test_semantic_cache_loads_model_once(mock_sentence_transformers, tmp_path):
+    from needlehaystack.evaluators.cache import SemanticScoreCache
+
+    def slow_load(name):
+        time.sleep(0.05)
+        return MagicMock()
+
+    mock_sentence_transformers.SentenceTransformer.side_effect = slow_load
+    cache = SemanticScoreCache(str(tmp_path / "index.npz"))
+
+    async def embed_concurrently():
+        await asyncio.gather(*(asyncio.to_thread(cache.embed, "Blue") for _ in range(8)))
+
+    asyncio.run(embed_concurrently())
+    assert mock_sentence_transformers.SentenceTransformer.call_count == 1
+
+
+def test_semantic_cache_path_survives_chdir(mock_sentence_transformers, tmp_path, monkeypatch):
+    from needlehaystack.evaluators.cache import SemanticScoreCache
+
+    (tmp_path / "elsewhere").mkdir()
+    cache = SemanticScoreCache("index.npz")
+    cache.add(np.array([1.0, 0.0], dtype=np.float32), 1)
+
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    cache.close()
+    assert (tmp_path / "index.npz").exists()
+    assert not (tmp_path / "elsewhere" / "index.npz").exists()
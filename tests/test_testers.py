@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import httpx
+from openai import APIConnectionError
+
+from needlehaystack import LLMNeedleHaystackTester, LLMMultiNeedleHaystackTester
+from needlehaystack.evaluators import Evaluator
+from needlehaystack.providers import ModelProvider
+
+NEEDLE = " The best thing to do in San Francisco is eat a sandwich. "
+RETRIEVAL_QUESTION = "What is the best thing to do in San Francisco?"
+CONTEXT_LENGTHS = [500, 1000]
+DEPTH_PERCENTS = [0, 50, 100]
+
+
+class StubProvider(ModelProvider):
+    model_name = "stub"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def evaluate_model(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return "Eat a sandwich."
+
+    def generate_prompt(self, context, retrieval_question):
+        return context
+
+    def encode_text_to_tokens(self, text):
+        return list(text.encode())
+
+    def decode_tokens(self, tokens, context_length=None):
+        return bytes(tokens[:context_length]).decode(errors="ignore")
+
+
+class StubEvaluator(Evaluator):
+    def evaluate_response(self, response):
+        return 10
+
+
+class FailingEvaluator(Evaluator):
+    """Fails its second evaluation the way the OpenAI evaluator surfaces API errors."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def evaluate_response(self, response):
+        self.calls += 1
+        if self.calls == 2:
+            raise APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        return 10
+
+
+def make_tester(tester_class=LLMNeedleHaystackTester, **kwargs):
+    kwargs.setdefault("evaluator", FailingEvaluator())
+    return tester_class(model_to_test=StubProvider(),
+                        needle=NEEDLE,
+                        retrieval_question=RETRIEVAL_QUESTION,
+                        context_lengths=CONTEXT_LENGTHS,
+                        document_depth_percents=DEPTH_PERCENTS,
+                        save_results=False,
+                        save_contexts=False,
+                        print_ongoing_status=False,
+                        **kwargs)
+
+
+def test_failed_test_does_not_stop_sweep():
+    tester = make_tester(num_concurrent_requests=3)
+    tester.start_test()
+
+    assert len(tester.get_results()) == len(CONTEXT_LENGTHS) * len(DEPTH_PERCENTS) - 1
+    assert len(tester.failed_tests) == 1
+
+
+def test_failed_test_does_not_stop_multi_needle_sweep():
+    tester = make_tester(LLMMultiNeedleHaystackTester, needles=[NEEDLE], num_concurrent_requests=3)
+    tester.start_test()
+
+    assert len(tester.get_results()) == len(CONTEXT_LENGTHS) * len(DEPTH_PERCENTS) - 1
+    assert len(tester.failed_tests) == 1
+
+
+def test_rate_limiter_allows_num_concurrent_requests_per_interval():
+    # 2 completions per 0.2s: the first two start at once, the remaining four at 0.1s spacing
+    for tester_class, kwargs in ((LLMNeedleHaystackTester, {}), (LLMMultiNeedleHaystackTester, {"needles": [NEEDLE]})):
+        tester = make_tester(tester_class, evaluator=StubEvaluator(), num_concurrent_requests=2,
+                             seconds_to_sleep_between_completions=0.2, **kwargs)
+
+        start = time.time()
+        tester.start_test()
+        elapsed = time.time() - start
+
+        assert tester.model_to_test.calls == len(CONTEXT_LENGTHS) * len(DEPTH_PERCENTS)
+        assert 0.35 <= elapsed < 2
+        # Waiting on the limiter is not counted as model latency
+        assert all(result['test_duration_seconds'] < 0.1 for result in tester.get_results())
+
+
+def test_no_rate_limiter_without_sleep_setting():
+    tester = make_tester(evaluator=StubEvaluator(), num_concurrent_requests=2)
+    assert tester.rate_limiter is None